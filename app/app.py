@@ -1,7 +1,7 @@
 import os
+from collections.abc import Iterator
 from pathlib import Path
 
-import indexing
 import query
 import streamlit as st
 from dotenv import load_dotenv
@@ -17,6 +17,10 @@ st.set_page_config(page_title="Medical RAG Chatbot", page_icon="🩺", layout="c
 @st.cache_resource  # type: ignore
 def init_indexing() -> bool:
     try:
+        # Imported lazily: the document parsing and OpenAI vision code is only
+        # needed when the Chroma database has to be built.
+        import indexing  # noqa: PLC0415
+
         indexing.main()
         return True
     except Exception as e:
@@ -24,28 +28,34 @@ def init_indexing() -> bool:
         return False
 
 
-def generate_response(message: str, history: list[dict[str, str]]) -> str:
+def generate_response(message: str, history: list[dict[str, str]]) -> Iterator[str]:
     """
     Handle a conversational turn with memory using the OpenAI chat model.
+
+    Retrieval and the completion request happen when the function is called;
+    the answer is then streamed so the interface can display tokens as soon
+    as they are generated.
+
     Args:
         message (str): The latest user message.
         history (list[dict[str, str]]): Conversation history where each dict
             contains "user_message" and "assistant_response".
 
     Returns:
-        str: The assistant's response to the current user message.
+        Iterator[str]: The fragments of the assistant's response to the
+        current user message.
     """
     context = "Tu es un assistant médical qui est entraîné à répondre à des questions sur les pneumopathies communautaires.\n\n"
     messages = [{"role": "system", "content": context}]
     messages.extend(history)
     prompt = query.build_prompt(message)
     messages.append({"role": "user", "content": prompt})
-    response = client.chat.completions.create(
+    stream = client.chat.completions.create(
         model="gpt-4o-mini",
         messages=messages,
+        stream=True,
     )
-    response_text = response.choices[0].message.content
-    return response_text  # type: ignore
+    return (chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
 
 
 def main() -> None:
@@ -78,8 +88,8 @@ def main() -> None:
 
         with st.chat_message("assistant"):
             with st.spinner("Recherche dans la base de connaissances..."):
-                response = generate_response(prompt, st.session_state.messages[:-1])
-            st.markdown(response)
+                response_stream = generate_response(prompt, st.session_state.messages[:-1])
+            response = st.write_stream(response_stream)
             st.session_state.messages.append({"role": "assistant", "content": response})
 
 
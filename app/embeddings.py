@@ -0,0 +1,169 @@
+import functools
+import os
+import threading
+from contextlib import AbstractContextManager, nullcontext
+from typing import TYPE_CHECKING
+
+import numpy as np
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    import torch
+    from model2vec import StaticModel
+    from sentence_transformers import SentenceTransformer
+
+MODEL_NAMES = {
+    "sbert": "sentence-transformers/all-MiniLM-L6-v2",
+    "onnx": "sentence-transformers/all-MiniLM-L6-v2",
+    "model2vec": "minishlab/potion-base-8M",
+}
+# The settings below are read at import time, which happens before the
+# callers run load_dotenv(), so load the .env file here.
+load_dotenv()
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sbert")
+if EMBEDDING_BACKEND not in MODEL_NAMES:
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND!r}, expected one of {sorted(MODEL_NAMES)}")
+MODEL_NAME = MODEL_NAMES[EMBEDDING_BACKEND]
+# INT8 dynamically quantized export shipped in the model repository.
+ONNX_FILE_NAME = os.getenv("EMB_ONNX_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+EMB_BATCH_SIZE = int(os.getenv("EMB_BATCH_SIZE", "64"))
+# Run the PyTorch model in half precision: FP16 on GPU, BF16 on CPUs with native support.
+EMB_HALF_PRECISION = os.getenv("EMB_HALF_PRECISION", "1") == "1"
+
+_MODEL: "SentenceTransformer | StaticModel | None" = None
+_MODEL_LOCK = threading.Lock()
+
+
+def get_embedder() -> "SentenceTransformer | StaticModel":
+    """
+    Return the shared embedding model, loading it on first use.
+
+    The model is kept as a module-level singleton so that indexing and
+    every user query reuse the same weights instead of reloading them.
+    The EMBEDDING_BACKEND environment variable selects the model:
+    "sbert" (default) loads the all-MiniLM-L6-v2 SentenceTransformer,
+    "onnx" serves the same model through ONNX Runtime with INT8 weights,
+    "model2vec" loads a static potion model that embeds by averaging
+    precomputed token vectors, without a transformer forward pass.
+
+    All models expose a compatible `encode(sentences, batch_size=...,
+    show_progress_bar=...)` returning numpy arrays. model2vec vectors have a
+    different dimension from MiniLM ones, so data/chroma_db must be deleted
+    and rebuilt when switching to or from that backend.
+
+    torch and the model libraries are imported here rather than at module
+    level, so importing this module stays cheap until an embedding is needed.
+    The PyTorch model uses one intra-op thread per CPU and, unless
+    EMB_HALF_PRECISION=0, FP16 weights on GPU or BF16 weights on CPUs with
+    AVX-512 BF16 support.
+
+    Returns:
+        SentenceTransformer | StaticModel: The embedding model.
+    """
+    global _MODEL  # noqa: PLW0603 - lazily initialized process-wide singleton
+    with _MODEL_LOCK:
+        if _MODEL is None:
+            _MODEL = _load_model()
+    return _MODEL
+
+
+def _load_model() -> "SentenceTransformer | StaticModel":
+    if EMBEDDING_BACKEND == "model2vec":
+        from model2vec import StaticModel  # noqa: PLC0415 - optional dependency, only needed for this backend
+
+        return StaticModel.from_pretrained(MODEL_NAME)
+
+    if EMBEDDING_BACKEND == "onnx":
+        import onnxruntime as ort  # noqa: PLC0415 - only needed for this backend
+        from sentence_transformers import SentenceTransformer  # noqa: PLC0415 - heavy, loaded on first use
+
+        session_options = ort.SessionOptions()
+        session_options.intra_op_num_threads = os.cpu_count() or 1
+        return SentenceTransformer(
+            MODEL_NAME,
+            backend="onnx",
+            model_kwargs={
+                "file_name": ONNX_FILE_NAME,
+                "provider": "CPUExecutionProvider",
+                "session_options": session_options,
+            },
+        )
+
+    import torch  # noqa: PLC0415 - heavy, loaded on first use
+    from sentence_transformers import SentenceTransformer  # noqa: PLC0415 - heavy, loaded on first use
+
+    torch.set_num_threads(os.cpu_count() or 4)
+    model = SentenceTransformer(MODEL_NAME)
+    model.eval()
+    dtype = _half_precision_dtype()
+    if dtype is not None:
+        model.to(dtype)
+    return model
+
+
+@functools.cache
+def _half_precision_dtype() -> "torch.dtype | None":
+    if EMBEDDING_BACKEND != "sbert" or not EMB_HALF_PRECISION:
+        return None
+    import torch  # noqa: PLC0415 - heavy, loaded on first use
+
+    # Mirrors SentenceTransformer's default device choice: CUDA first, then MPS, then CPU.
+    if torch.cuda.is_available():
+        return torch.float16
+    if torch.backends.mps.is_available():
+        return None
+    # torch has no public API to detect native BF16 support on CPU, so use the
+    # private helper when this torch version has it and fall back to FP32.
+    is_bf16_supported = getattr(torch.cpu, "_is_avx512_bf16_supported", lambda: False)
+    return torch.bfloat16 if is_bf16_supported() else None
+
+
+@functools.cache
+def embedder_id() -> str:
+    """
+    Identify the vectors produced by `encode`, for use in cache keys.
+
+    The identifier covers the backend, the model, the precision it runs in
+    (the ONNX export file for the ONNX backend) and the normalization, so
+    cached vectors are never reused across settings that change them.
+
+    Returns:
+        str: The embedder identifier.
+    """
+    if EMBEDDING_BACKEND == "onnx":
+        precision = ONNX_FILE_NAME
+    else:
+        dtype = _half_precision_dtype()
+        precision = "float32" if dtype is None else str(dtype).removeprefix("torch.")
+    return f"{EMBEDDING_BACKEND}:{MODEL_NAME}:{precision}:normalized"
+
+
+def _inference_context() -> AbstractContextManager[object]:
+    if EMBEDDING_BACKEND == "model2vec":
+        return nullcontext()
+    import torch  # noqa: PLC0415 - heavy, loaded on first use
+
+    return torch.inference_mode()
+
+
+def encode(texts: str | list[str]) -> np.ndarray:
+    """
+    Embed one text or a batch of texts with the shared embedding model.
+
+    This is the single encoding path used by both indexing and querying,
+    so documents and queries are always embedded the same way. Embeddings
+    are L2-normalized, so that the inner product used by the Chroma
+    collection equals the cosine similarity the models are trained for.
+
+    Args:
+        texts (str | list[str]): A single text or a list of texts.
+
+    Returns:
+        np.ndarray: A unit-norm float32 vector for a single text, or a float32
+        matrix with one unit-norm row per text.
+    """
+    model = get_embedder()
+    with _inference_context():
+        embeddings = np.asarray(model.encode(texts, batch_size=EMB_BATCH_SIZE, show_progress_bar=False), dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, np.finfo(np.float32).tiny)
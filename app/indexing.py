@@ -1,26 +1,105 @@
+import asyncio
 import base64
+import hashlib
 import os
 import re
-import sys
+import sqlite3
+from collections.abc import Callable, Iterator
+from contextlib import closing
 from pathlib import Path
 from typing import Any
 
-try:
-    __import__("pysqlite3")
-    sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
-except ImportError:
-    pass
+import sqlite_compat  # noqa: F401 - swaps in pysqlite3, must run before chromadb is imported
+
+# isort: split
 import chromadb
+import numpy as np
 from docx import Document
-from docx.table import Table
+from docx.document import Document as DocxDocument
+from docx.table import Table, _Row
 from docx.text.paragraph import Paragraph
 from dotenv import load_dotenv
-from openai import OpenAI
-from sentence_transformers import SentenceTransformer
+from embeddings import embedder_id, encode
+from openai import AsyncOpenAI
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=OPENAI_API_KEY)
+CACHE_DIR = Path("data/.cache")
+MAX_CONCURRENT_SUMMARIES = 4
+SECTION_PATTERN = re.compile(r"[A-Z]-")
+# (has_header_row, has_header_column) for each table of the document, in order
+TABLE_HEADERS = (
+    (False, True),
+    (False, False),
+    (True, False),
+    (True, False),
+    (True, True),
+    (True, False),
+    (True, False),
+)
+DEFAULT_TABLE_HEADER = (True, False)
+
+
+def _cell_texts(row: _Row) -> list[str]:
+    return [cell.text.strip() for cell in row.cells]
+
+
+def _summarize_row_header(rows: Iterator[_Row]) -> list[str]:
+    # Case 1 : Row header only
+    narrative: list[str] = []
+    header_row = next(rows, None)
+    if header_row is None:
+        return narrative
+    headers = _cell_texts(header_row)
+    for row in rows:
+        cells = _cell_texts(row)
+        if len(set(cells)) == 1 and cells[0]:
+            narrative.append(f"Note: {cells[0]}")
+        else:
+            items = [f"{h}: {c}" for h, c in zip(headers, cells, strict=False) if c]
+            if items:
+                narrative.append("- " + ", ".join(items))
+    return narrative
+
+
+def _summarize_column_header(rows: Iterator[_Row]) -> list[str]:
+    # Case 2 : Column header only
+    narrative: list[str] = []
+    for row in rows:
+        cells = _cell_texts(row)
+        items = [c for c in cells[1:] if c]
+        if items:
+            narrative.append(f"- {cells[0]}: {', '.join(items)}")
+    return narrative
+
+
+def _summarize_row_and_column_headers(rows: Iterator[_Row]) -> list[str]:
+    # Case 3 : Row header + column header
+    narrative: list[str] = []
+    header_row = next(rows, None)
+    if header_row is None:
+        return narrative
+    col_headers = _cell_texts(header_row)[1:]  # ignore (0,0)
+    for row in rows:
+        cells = _cell_texts(row)
+        row_header = cells[0]
+        for j, cell in enumerate(cells[1:]):
+            narrative.append(f"- {col_headers[j]} et {row_header}: {cell}")
+    return narrative
+
+
+def _summarize_no_header(rows: Iterator[_Row]) -> list[str]:
+    # Case 4 : No headers
+    return ["- " + ", ".join(c for c in _cell_texts(row) if c) for row in rows]
+
+
+# Indexed by (has_header_row, has_header_column)
+_TABLE_SUMMARIZERS: dict[tuple[bool, bool], Callable[[Iterator[_Row]], list[str]]] = {
+    (True, False): _summarize_row_header,
+    (False, True): _summarize_column_header,
+    (True, True): _summarize_row_and_column_headers,
+    (False, False): _summarize_no_header,
+}
 
 
 def summarize_table(
@@ -33,7 +112,8 @@ def summarize_table(
 
     The function reads the content of a `docx.table.Table`, extracts its cells,
     and generates a human-readable narrative depending on whether the table
-    contains a header row, a header column, both, or neither.
+    contains a header row, a header column, both, or neither. The rows are
+    read in a single pass, without building the full cell matrix.
 
     Args:
         table (Table): A `python-docx` Table object to summarize.
@@ -44,66 +124,22 @@ def summarize_table(
         str: A textual summary of the table content, formatted with bullet points
         and optional headers based on the provided arguments.
     """
-    rows = list(table.rows)
-    if not rows:
-        return ""
+    summarizer = _TABLE_SUMMARIZERS[(bool(has_header_row), bool(has_header_column))]
+    return "\n".join(summarizer(iter(table.rows)))
 
-    # Construire la matrice des cellules
-    matrix = [[cell.text.strip() for cell in row.cells] for row in rows]
 
-    narrative = []
-
-    # Case 1 : Row header only
-    if has_header_row and not has_header_column:
-        headers = matrix[0]
-        for row in matrix[1:]:
-            if len(set(row)) == 1 and row[0]:
-                narrative.append(f"Note: {row[0]}")
-            else:
-                items = [f"{h}: {c}" for h, c in zip(headers, row, strict=False) if c]
-                if items:
-                    narrative.append("- " + ", ".join(items))
-
-    # Caes 2 : Column header only
-    elif has_header_column and not has_header_row:
-        for row in matrix:
-            header = row[0]
-            values = row[1:]
-            items = [c for c in values if c]
-            if items:
-                narrative.append(f"- {header}: {', '.join(items)}")
-
-    # Casee 3 : Row header + column header
-    elif has_header_row and has_header_column:
-        col_headers = matrix[0][1:]  # ignore (0,0)
-        for row in matrix[1:]:
-            row_header = row[0]
-            values = row[1:]
-            for j, cell in enumerate(values):
-                col_header = col_headers[j]
-                narrative.append(f"- {col_header} et {row_header}: {cell}")
-
-    # Case 4 : No headers
-    else:
-        for row in matrix:
-            narrative.append("- " + ", ".join(c for c in row if c))
-
-    return "\n".join(narrative)
-
-
-def extract_image_from_docx(docx_path: Path, output_path: Path) -> None:
-    doc = Document(docx_path)
+def extract_image_from_docx(doc: DocxDocument, output_path: Path | None = None) -> bytes | None:
+    image_data = None
     for rel in doc.part.rels.values():
         if "image" in rel.target_ref:
             image_data = rel.target_part.blob
-            with open(output_path, "wb") as img_file:
-                img_file.write(image_data)
+    if image_data is not None and output_path is not None:
+        output_path.write_bytes(image_data)
+    return image_data
 
 
-def summarize_image(image_path: Path) -> str:
-    with open(image_path, "rb") as f:
-        img_bytes = f.read()
-    img_b64 = base64.b64encode(img_bytes).decode("utf-8")
+async def summarize_image_async(client: AsyncOpenAI, img_bytes: bytes) -> str:
+    image_url = "".join(("data:image/png;base64,", base64.b64encode(memoryview(img_bytes)).decode("ascii")))
 
     prompt = (
         "Analyse attentivement cette image. "
@@ -114,7 +150,7 @@ def summarize_image(image_path: Path) -> str:
         "- Structure du schéma : décris en utilisant le texte exact dans chaque bloc du schéma, le processus de prise en charge d'un patient atteint d'une pneumonie communautaire.\n"
     )
 
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "Tu es un assistant médical qui décrit des schémas."},
@@ -122,7 +158,7 @@ def summarize_image(image_path: Path) -> str:
                 "role": "user",
                 "content": [
                     {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_b64}"}},
+                    {"type": "image_url", "image_url": {"url": image_url}},
                 ],
             },
         ],
@@ -131,43 +167,79 @@ def summarize_image(image_path: Path) -> str:
     return response.choices[0].message.content  # type: ignore
 
 
-def chunk_paragraph_and_tables(docx_path: Path) -> list[str]:
+async def get_image_summary(client: AsyncOpenAI, img_bytes: bytes, semaphore: asyncio.Semaphore) -> str:
+    """
+    Summarize an image, reusing a previous summary of the same image.
+
+    Summaries are cached in CACHE_DIR under the SHA-256 of the image bytes,
+    so re-indexing an unchanged document does not call the OpenAI API again.
+
+    Args:
+        client (AsyncOpenAI): The OpenAI client used on a cache miss.
+        img_bytes (bytes): The PNG image to summarize.
+        semaphore (asyncio.Semaphore): Limits the number of concurrent API calls.
+
+    Returns:
+        str: The image summary.
+    """
+    digest = hashlib.sha256(img_bytes).hexdigest()
+    cache_path = CACHE_DIR / f"img_{digest}.txt"
+    if cache_path.exists():
+        return cache_path.read_text(encoding="utf-8")
+    async with semaphore:
+        image_summary = await summarize_image_async(client, img_bytes)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    cache_path.write_text(image_summary, encoding="utf-8")
+    return image_summary
+
+
+async def summarize_images(images: list[bytes]) -> list[str]:
+    """
+    Summarize several images concurrently.
+
+    At most MAX_CONCURRENT_SUMMARIES requests are sent to the OpenAI API at
+    the same time.
+
+    Args:
+        images (list[bytes]): The PNG images to summarize.
+
+    Returns:
+        list[str]: The image summaries, in the same order as `images`.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SUMMARIES)
+    async with AsyncOpenAI(api_key=OPENAI_API_KEY) as client:
+        return await asyncio.gather(*(get_image_summary(client, img_bytes, semaphore) for img_bytes in images))
+
+
+def chunk_paragraph_and_tables(doc: DocxDocument) -> list[str]:
     """
     Split a DOCX document into text chunks by paragraphs and tables.
 
     The function iterates through each section of the Word document, extracting
     paragraphs and converting tables into narrative form. Sections starting
     with a pattern like "A-", "B-", etc. trigger the start of a new chunk.
+    Tables beyond those listed in TABLE_HEADERS are summarized with a header
+    row only.
 
     Args:
-        docx_path (Path): Path to the DOCX file to process.
+        doc (DocxDocument): The loaded `python-docx` document to process.
 
     Returns:
         list[str]: A list of text chunks where each chunk may contain
         paragraphs and/or table narratives.
     """
-    doc = Document(docx_path)
-    has_header = [
-        (False, True),
-        (False, False),
-        (True, False),
-        (True, False),
-        (True, True),
-        (True, False),
-        (True, False),
-    ]
     chunks = []
     table_index = 0
     for section in doc.sections:
         current_chunk = ""
         for element in section.iter_inner_content():
-            section_pattern = re.compile(r"^[A-Z]-.*")
             if isinstance(element, Table):
-                current_chunk += summarize_table(element, *has_header[table_index]) + "\n"
+                header = TABLE_HEADERS[table_index] if table_index < len(TABLE_HEADERS) else DEFAULT_TABLE_HEADER
+                current_chunk += summarize_table(element, *header) + "\n"
                 table_index += 1
             elif isinstance(element, Paragraph):
                 text = element.text
-                if section_pattern.match(text):
+                if SECTION_PATTERN.match(text):
                     chunks.append(current_chunk.strip())
                     current_chunk = ""
                 current_chunk += text.strip() + "\n"
@@ -175,44 +247,82 @@ def chunk_paragraph_and_tables(docx_path: Path) -> list[str]:
     return chunks
 
 
-def chunk_document(docx_path: Path, image_path: Path) -> list[str]:
+def chunk_document(docx_path: Path, image_path: Path | None = None) -> list[dict[str, str]]:
     """
-    Split a DOCX document into text chunks and append an image summary.
+    Split a DOCX document into text chunks and add the image summary as its own chunk.
+
+    The image is summarized straight from the bytes embedded in the document.
 
     Args:
         docx_path (Path): Path to the DOCX file to process.
-        image_path (Path): Path where the extracted image will be stored and
-            then summarized.
+        image_path (Path | None, optional): If given, the extracted image is
+            also written there for inspection. Defaults to None.
 
     Returns:
-        list[str]: A list of text chunks with the image description appended
-        to the final chunk.
+        list[dict[str, str]]: One dict per chunk with its "chunk" text and its
+        "type", either "text" or "image_summary".
     """
-    chunks = chunk_paragraph_and_tables(docx_path)
-    if not image_path.exists():
-        extract_image_from_docx(docx_path, image_path)
-    image_summary = summarize_image(image_path)
-    chunks[-1] += "\n" + image_summary
+    doc = Document(docx_path)
+    chunks = [{"chunk": chunk, "type": "text"} for chunk in chunk_paragraph_and_tables(doc)]
+    img_bytes = extract_image_from_docx(doc, image_path)
+    if img_bytes is not None:
+        (image_summary,) = asyncio.run(summarize_images([img_bytes]))
+        chunks.append({"chunk": image_summary, "type": "image_summary"})
     return chunks
 
 
-def create_embeddings(chunks: list[str]) -> list[dict[str, Any]]:
-    data_with_embeddings = []
-    embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    for chunk in chunks:
-        chunk_embedding = embedding_model.encode(chunk).tolist()
-        data_with_embeddings.append({"chunk": chunk, "embedding": chunk_embedding})
-    return data_with_embeddings
+def create_embeddings(chunks: list[dict[str, str]]) -> list[dict[str, Any]]:
+    """
+    Embed text chunks, reusing embeddings of chunks that did not change.
+
+    Embeddings are cached in a SQLite table keyed by the SHA-256 of the chunk
+    text and the embedder identifier (backend, model, precision), so only new or
+    edited chunks are encoded.
+
+    Args:
+        chunks (list[dict[str, str]]): The chunks to embed, as returned by
+            `chunk_document`.
+
+    Returns:
+        list[dict[str, Any]]: The input chunks, each with an added
+        "embedding" as a float32 numpy array.
+    """
+    texts = [chunk["chunk"] for chunk in chunks]
+    embedder = embedder_id()
+    keys = [hashlib.sha256((text + embedder).encode("utf-8")).hexdigest() for text in texts]
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with closing(sqlite3.connect(CACHE_DIR / "embeddings.sqlite3")) as conn, conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, embedding BLOB NOT NULL)")
+        cached: dict[str, np.ndarray] = {}
+        for key in set(keys):
+            row = conn.execute("SELECT embedding FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                cached[key] = np.frombuffer(row[0], dtype=np.float32)
+
+        missing = {key: text for key, text in zip(keys, texts, strict=True) if key not in cached}
+        if missing:
+            embeddings = encode(list(missing.values()))
+            for key, embedding in zip(missing, embeddings, strict=True):
+                cached[key] = embedding
+                conn.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", (key, embedding.tobytes()))
+    return [{**chunk, "embedding": cached[key]} for chunk, key in zip(chunks, keys, strict=True)]
 
 
 def store_embeddings_in_chroma(data_with_embeddings: list[dict[str, Any]], chroma_db_path: Path) -> None:
     client = chromadb.PersistentClient(path=chroma_db_path)
-    collection = client.get_or_create_collection(name="medical_rag")
-    for i, item in enumerate(data_with_embeddings):
+    collection = client.get_or_create_collection(name="medical_rag", metadata={"hnsw:space": "ip"})
+    ids = [f"chunk_{i}" for i in range(len(data_with_embeddings))]
+    embeddings = np.vstack([item["embedding"] for item in data_with_embeddings])
+    documents = [item["chunk"] for item in data_with_embeddings]
+    metadatas = [{"type": item["type"]} for item in data_with_embeddings]
+    batch_size = client.get_max_batch_size()
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
         collection.add(
-            ids=[f"chunk_{i}"],
-            embeddings=[item["embedding"]],
-            documents=[item["chunk"]],
+            ids=ids[start:end],
+            embeddings=embeddings[start:end],
+            documents=documents[start:end],
+            metadatas=metadatas[start:end],
         )
 
 
@@ -225,9 +335,9 @@ def main() -> None:
     ChromaDB database for later retrieval.
     """
     docx_path = Path("data/Prise en charge des Pneumopathies aigues communautaires V2.docx")
-    image_path = Path("data/extracted_image.png")
     chroma_db_path = Path("data/chroma_db")
-    if not chroma_db_path.exists():
-        chunks = chunk_document(docx_path, image_path)
-        data_with_embeddings = create_embeddings(chunks)
-        store_embeddings_in_chroma(data_with_embeddings, chroma_db_path)
+    if chroma_db_path.exists():
+        return
+    chunks = chunk_document(docx_path)
+    data_with_embeddings = create_embeddings(chunks)
+    store_embeddings_in_chroma(data_with_embeddings, chroma_db_path)
@@ -1,16 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
 from typing import Any
 
+import sqlite_compat  # noqa: F401 - swaps in pysqlite3, must run before chromadb is imported
+
+# isort: split
 import chromadb
-from sentence_transformers import SentenceTransformer
+import numpy as np
+from chromadb.api.models.Collection import Collection
+from embeddings import encode
+
+_CLIENT: chromadb.ClientAPI | None = None
+_COLLECTION: Collection | None = None
+_COLLECTION_LOCK = threading.Lock()
+
+QUERY_CACHE_MAXSIZE = 1024
+QUERY_CACHE_TTL = 300.0
+_QUERY_CACHE: OrderedDict[str, tuple[np.ndarray, float]] = OrderedDict()
+_CACHE_STATS = {"hits": 0, "misses": 0}
+_QUERY_CACHE_LOCK = threading.Lock()
+
+_PROMPT_HEADER = "Voici quelques informations du document de prise en charge des pneumopathies aigues communautaires qui pourraient être utiles pour répondre aux questions de l'utilisateur:\n---\n"
+_FORMAT_INSTRUCTIONS = (
+    "Ta réponse doit OBLIGATOIREMENT suivre ce format :\n\n"
+    "Réponse : (fournis une réponse complète et synthétisée basée UNIQUEMENT sur les informations ci-dessus)\n\n"
+    "Source : (Liste les passages exacts et leur parties dans le texte utilisés pour répondre. "
+    "Si le passage provient d’un tableau ou d’une annexe, inclue également son titre, par exemple : "
+    "Si tu ne trouves pas la réponse dans les informations fournies, ne réponds pas à la question,"
+    "tu peux dire que tu n'as pas la réponse."
+)
+
+
+def get_collection() -> Collection:
+    """
+    Return the shared handle on the "medical_rag" Chroma collection.
+
+    The persistent client and the collection are opened once and reused
+    for every query instead of reopening the database on each call.
+
+    Returns:
+        Collection: The Chroma collection holding the document chunks.
+    """
+    global _CLIENT, _COLLECTION  # noqa: PLW0603 - lazily initialized process-wide singletons
+    with _COLLECTION_LOCK:
+        if _COLLECTION is None:
+            if _CLIENT is None:
+                _CLIENT = chromadb.PersistentClient(path=Path("data/chroma_db"))
+            _COLLECTION = _CLIENT.get_collection(name="medical_rag")
+    return _COLLECTION
+
+
+def _embed_query(query: str) -> np.ndarray:
+    """
+    Embed a query, reusing the result of a recent identical query.
+
+    Queries are normalized (stripped and lowercased) before lookup. The
+    cache keeps at most QUERY_CACHE_MAXSIZE entries, evicting the least
+    recently used one, and entries expire after QUERY_CACHE_TTL seconds.
+    Cache accesses are serialized with a lock since Streamlit sessions run in
+    separate threads; the encoding itself runs outside the lock.
+
+    Args:
+        query (str): The user question or search query.
+
+    Returns:
+        np.ndarray: The query embedding as a read-only float32 array.
+    """
+    key = query.strip().lower()
+    now = time.monotonic()
+    with _QUERY_CACHE_LOCK:
+        cached = _QUERY_CACHE.get(key)
+        if cached is not None:
+            embedding, timestamp = cached
+            if now - timestamp < QUERY_CACHE_TTL:
+                _QUERY_CACHE.move_to_end(key)
+                _CACHE_STATS["hits"] += 1
+                return embedding
+            del _QUERY_CACHE[key]
+        _CACHE_STATS["misses"] += 1
+
+    embedding = encode(key)
+    embedding.setflags(write=False)
+    with _QUERY_CACHE_LOCK:
+        _QUERY_CACHE[key] = (embedding, now)
+        _QUERY_CACHE.move_to_end(key)
+        if len(_QUERY_CACHE) > QUERY_CACHE_MAXSIZE:
+            _QUERY_CACHE.popitem(last=False)
+    return embedding
+
+
+def cache_stats() -> dict[str, int]:
+    """
+    Return the query embedding cache counters.
+
+    Returns:
+        dict[str, int]: Number of hits, misses and entries currently cached.
+    """
+    with _QUERY_CACHE_LOCK:
+        return {**_CACHE_STATS, "size": len(_QUERY_CACHE)}
 
 
 def query_chroma(query: str, n_results: int = 3) -> list[dict[str, Any]]:
     """
     Query the Chroma vector database with a natural language question.
 
-    The function encodes the input query into an embedding using a
-    SentenceTransformer model, then searches the Chroma collection for
+    The function encodes the input query into an embedding using the
+    shared embedding model (cached for repeated questions), then searches the Chroma collection for
     the most semantically similar document chunks.
 
     Args:
@@ -21,15 +118,11 @@ def query_chroma(query: str, n_results: int = 3) -> list[dict[str, Any]]:
     Returns:
         list[dict]: Query results from Chroma
     """
-    chroma_db_path = Path("data/chroma_db")
-    client = chromadb.PersistentClient(path=chroma_db_path)
-    collection = client.get_collection(name="medical_rag")
-
-    embedding_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    query_embedding = embedding_model.encode(query).tolist()
+    collection = get_collection()
+    query_embedding = _embed_query(query)
 
     results = collection.query(
-        query_embeddings=[query_embedding],
+        query_embeddings=query_embedding.reshape(1, -1),
         n_results=n_results,
     )
     return results  # type: ignore
@@ -38,17 +131,8 @@ def query_chroma(query: str, n_results: int = 3) -> list[dict[str, Any]]:
 def build_prompt(query: str) -> str:
     results = query_chroma(query=query)
     retrieved_chunks = results["documents"][0]  # type: ignore
-    prompt = "Voici quelques informations du document de prise en charge des pneumopathies aigues communautaires qui pourraient être utiles pour répondre aux questions de l'utilisateur:\n---\n"
-    for chunk in retrieved_chunks:
-        prompt += chunk + "\n\n"
-
-    prompt += f"\nUser Question: {query}\n\n"
-    prompt += (
-        "Ta réponse doit OBLIGATOIREMENT suivre ce format :\n\n"
-        "Réponse : (fournis une réponse complète et synthétisée basée UNIQUEMENT sur les informations ci-dessus)\n\n"
-        "Source : (Liste les passages exacts et leur parties dans le texte utilisés pour répondre. "
-        "Si le passage provient d’un tableau ou d’une annexe, inclue également son titre, par exemple : "
-        "Si tu ne trouves pas la réponse dans les informations fournies, ne réponds pas à la question,"
-        "tu peux dire que tu n'as pas la réponse."
-    )
-    return prompt
+    parts = [_PROMPT_HEADER]
+    parts.extend(chunk + "\n\n" for chunk in retrieved_chunks)
+    parts.append(f"\nUser Question: {query}\n\n")
+    parts.append(_FORMAT_INSTRUCTIONS)
+    return "".join(parts)
@@ -0,0 +1,11 @@
+import sys
+
+# chromadb requires SQLite >= 3.35, newer than the system library on some
+# platforms (e.g. the Debian bullseye devcontainer image). When the
+# pysqlite3-binary wheel is installed, use it in place of the standard
+# sqlite3 module. This module must be imported before chromadb.
+try:
+    __import__("pysqlite3")
+    sys.modules["sqlite3"] = sys.modules.pop("pysqlite3")
+except ImportError:
+    pass